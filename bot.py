@@ -1,26 +1,49 @@
+import asyncio
+import bisect
+import functools
 import logging
 import os
-import requests
+import random
 import threading
 import time
 import html
-from flask import Flask 
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import orjson
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-import pytz
+from itertools import chain, repeat
+from operator import attrgetter
+from zoneinfo import ZoneInfo
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler
+from telegram.ext import AIORateLimiter, ApplicationBuilder, ContextTypes, CommandHandler, CallbackQueryHandler, TypeHandler
 from telegram.error import BadRequest
 
 # --- WEB SERVER (KEEPS BOT ALIVE) --- #
-app = Flask(__name__)
+HEALTH_BODY = b"GEG Flight Tracker"
 
-@app.route('/')
-def health_check():
-    return "GEG Flight Tracker"
+class HealthCheckHandler(BaseHTTPRequestHandler):
+    def send_health_headers(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(HEALTH_BODY)))
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_health_headers()
+        self.wfile.write(HEALTH_BODY)
+
+    # Uptime pingers often probe with HEAD; answer without a 501
+    def do_HEAD(self):
+        self.send_health_headers()
+
+    # Render pings every few seconds; don't flood the bot log with them
+    def log_message(self, format, *args):
+        pass
 
 def run_web_server():
     port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port)
+    ThreadingHTTPServer(('0.0.0.0', port), HealthCheckHandler).serve_forever()
 
 # --- CONFIGURATION --- #
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
@@ -28,7 +51,7 @@ AIRLABS_API_KEY = os.getenv("AIRLABS_API_KEY")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 
 AIRPORT_IATA = 'GEG'
-TIMEZONE = pytz.timezone('America/Los_Angeles')
+TIMEZONE = ZoneInfo('America/Los_Angeles')
 
 # --- EXPLANATION TEXT --- #
 CHECK_SCREEN_EXPLANATION = (
@@ -38,6 +61,11 @@ CHECK_SCREEN_EXPLANATION = (
     "depend on the day's arrangement with the marketing partner."
 )
 
+# QA FIX: Correct Google Maps Universal Link
+CELL_LOT_MAP_URL = "https://www.google.com/maps/search/?api=1&query=Spokane+International+Airport+Cell+Phone+Waiting+Lot"
+# The button never changes, so build the markup once
+NAV_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🗺️ Nav to Waiting Lot", url=CELL_LOT_MAP_URL)]])
+
 # --- DATA MAPS --- #
 AIRLINE_NAMES = {
     'AA': 'American', 'AS': 'Alaska', 'DL': 'Delta', 'UA': 'United',
@@ -50,6 +78,9 @@ AIRLINE_NAMES = {
     'AF': 'Air France', 'KL': 'KLM', 'QR': 'Qatar Airways', 'WS': 'WestJet'
 }
 
+# Display-ready (HTML-escaped) names, built once at import
+AIRLINE_LABELS = {code: html.escape(name) for code, name in AIRLINE_NAMES.items()}
+
 TERMINAL_MAP = {
     'DL': 'Zone A/B (Rotunda)', 'UA': 'Zone A/B (Rotunda)',
     'WN': 'Zone A/B (Rotunda)', 'SY': 'Zone A/B (Rotunda)',
@@ -61,40 +92,351 @@ TERMINAL_MAP = {
     'BA': 'Zone C (North)', 'JL': 'Zone C (North)'
 }
 
+# Airlines seen without a TERMINAL_MAP entry, so each is only logged once
+unmapped_airlines = set()
+
+# Cargo and charter operators, never passenger demand
+CARGO_AIRLINES = frozenset({'FX', '5X', 'PO', 'K4', 'QY', 'ABX', 'ATI'})
+
+# --- FLIGHT RECORD --- #
+@dataclass(frozen=True, slots=True)
+class Flight:
+    airline_safe: str
+    code: str
+    num: str
+    time: datetime
+    time_str: str
+    zone: str
+    check_screen: bool
+    status: str
+    status_icon: str
+    cancelled: bool
+    is_problem: bool
+
+flight_time = attrgetter('time')
+
+# --- BOARD LAYOUTS --- #
+BOARDS = {
+    'arrival': {
+        'header': "🛬 <b>ARRIVALS</b>\nTime | Airline | Flight | Pickup | Zone\n",
+        'loading': "📡 Fetching Arrivals...",
+        'empty': "No upcoming arrivals."
+    },
+    'departure': {
+        'header': "🛫 <b>DEPARTURES</b>\nTime | Airline | Flight | Zone\n",
+        'loading': "📡 Fetching Departures...",
+        'empty': "No upcoming departures."
+    }
+}
+
 # --- GLOBAL CACHE --- #
 flight_cache = {
-    "arrival": {"data": None, "timestamp": 0},
-    "departure": {"data": None, "timestamp": 0}
+    "arrival": {"data": None, "timestamp": 0, "expires": 0, "stale": False},
+    "departure": {"data": None, "timestamp": 0, "expires": 0, "stale": False}
 }
 CACHE_DURATION = 900 
+MAX_CACHE_DURATION = 3600
+# TTLs are scaled by a random factor in this range so refreshes don't line up
+CACHE_JITTER = (0.75, 1.25)
+jitter_rng = random.SystemRandom()
+
+# Raw AirLabs payloads are mirrored here so a restart can reuse them
+CACHE_DIR = os.getenv('CACHE_DIR', '/tmp/geg_cache')
+
+# When AirLabs fails, the last good list is served (and marked) for this long
+# before the next attempt
+STALE_RETRY_DELAY = 300
+STALE_NOTE = "\n\n⚠️ <i>AirLabs is unreachable, showing cached data.</i>"
+
+# After a 429, no AirLabs calls at all until this time
+api_backoff = {"until": 0}
+RATE_LIMIT_BACKOFF = 300
+
+# Hit/miss counters, logged every CACHE_STATS_INTERVAL lookups
+cache_stats = {"hits": 0, "misses": 0}
+CACHE_STATS_INTERVAL = 50
+
+# Weather at one airport barely changes minute to minute
+weather_cache = {"value": None, "expires": 0}
+WEATHER_CACHE_DURATION = 600
+WEATHER_RETRY_DELAY = 60
+weather_lock = asyncio.Lock()
+
+# Background prefetch only runs while someone has used the bot recently
+last_user_activity = {"time": 0}
+ACTIVE_USER_WINDOW = 3600
+PREFETCH_INTERVAL = 60
+PREFETCH_LEAD = 60
+
+# Last time each (chat, command) pair ran, for the per-chat cooldown
+last_command_call = {}
+COMMAND_COOLDOWN = 5
+
+# Rendered board text, reused until the flight list it came from is replaced
+# or the board's first row moves on
+board_cache = {
+    "arrival": {"source": None, "start": None, "text": None},
+    "departure": {"source": None, "start": None, "text": None}
+}
+
+# Merged arrival+departure problem list, keyed by both cache timestamps
+problem_cache = {"key": None, "data": None}
+
+# One lock per mode so concurrent cache misses share a single AirLabs call
+flight_locks = {"arrival": asyncio.Lock(), "departure": asyncio.Lock()}
+
+# Shared async HTTP client; API calls no longer block the event loop.
+# Keep-alive connections are pooled and every call gets a hard timeout.
+# The transport retries failed connects so a dropped keep-alive socket
+# doesn't cost a whole refresh.
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(10, connect=3),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=4)
+    )
+)
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+# httpx logs full request URLs at INFO, and ours carry API keys and the bot token
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # --- HELPER FUNCTIONS --- #
 def get_spokane_time():
     return datetime.now(TIMEZONE)
 
-def get_weather():
+async def get_weather():
+    if time.time() < weather_cache["expires"]:
+        return weather_cache["value"]
+
+    async with weather_lock:
+        # Another /status may have refreshed it while we waited
+        if time.time() < weather_cache["expires"]:
+            return weather_cache["value"]
+        return await refresh_weather()
+
+async def refresh_weather():
     url = f"http://api.openweathermap.org/data/2.5/weather?lat=47.619&lon=-117.535&appid={WEATHER_API_KEY}&units=imperial"
     try:
-        r = requests.get(url, timeout=5).json()
-        if r.get('cod') != 200: return None, "Unavailable"
-        temp = round(r['main']['temp'])
-        desc = r['weather'][0]['description'].title()
-        return temp, desc
-    except:
-        return None, "Unavailable"
-
-def fetch_flights(mode):
-    global flight_cache
+        r = orjson.loads((await http_client.get(url)).content)
+        if r.get('cod') == 200:
+            temp = round(r['main']['temp'])
+            desc = r['weather'][0]['description'].title()
+            weather_cache["value"] = (temp, desc)
+            weather_cache["expires"] = time.time() + WEATHER_CACHE_DURATION
+            return temp, desc
+    except (httpx.HTTPError, ValueError, KeyError, IndexError, TypeError, AttributeError):
+        pass
+    # Remember the failure briefly so an outage (or a bad key) isn't retried
+    # on every /status
+    weather_cache["value"] = (None, "Unavailable")
+    weather_cache["expires"] = time.time() + WEATHER_RETRY_DELAY
+    return None, "Unavailable"
+
+def derive_ttl(flights, now):
+    # Nothing on the board changes until the next flight gets close, so quiet
+    # stretches (overnight) can be cached longer. Busy periods keep the base TTL.
+    start = bisect.bisect_left(flights, now, key=flight_time)
+    next_flight = next((f for f in flights[start:] if not f.cancelled), None)
+    if next_flight is None:
+        return MAX_CACHE_DURATION
+    seconds_to_next = (next_flight.time - now).total_seconds()
+    return min(max(seconds_to_next - CACHE_DURATION, CACHE_DURATION), MAX_CACHE_DURATION)
+
+def record_cache_lookup(hit):
+    cache_stats["hits" if hit else "misses"] += 1
+    total = cache_stats["hits"] + cache_stats["misses"]
+    if total % CACHE_STATS_INTERVAL == 0:
+        logger.info(f"Flight cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+def cache_path(mode):
+    return os.path.join(CACHE_DIR, f"{mode}.json")
+
+def save_cache_file(mode, raw_flights, timestamp, expires):
+    # Write to a temp file then rename, so a crash never leaves half a file
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = cache_path(mode)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as fh:
+            fh.write(orjson.dumps({'timestamp': timestamp, 'expires': expires, 'response': raw_flights}))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write cache file: {e}")
+
+def load_cache_file(mode):
+    try:
+        with open(cache_path(mode), 'rb') as fh:
+            saved = orjson.loads(fh.read())
+    except (OSError, ValueError):
+        return None
+    if time.time() >= saved.get('expires', 0):
+        return None
+    return saved
+
+def store_flights(mode, flights, timestamp, expires, stale=False):
+    # Swap in a whole new entry so anyone holding the old one keeps a
+    # consistent view (never new data with an old timestamp)
+    flight_cache[mode] = {"data": flights, "timestamp": timestamp, "expires": expires, "stale": stale}
+
+def stale_note(*modes):
+    return STALE_NOTE if any(flight_cache[mode]["stale"] for mode in modes) else ""
+
+def fresh_flights(mode):
+    cache = flight_cache[mode]
+    if cache["data"] is not None and time.time() < cache["expires"]:
+        return cache["data"]
+    return None
+
+async def fetch_flights(mode, now):
+    flights = fresh_flights(mode)
+    if flights is None:
+        async with flight_locks[mode]:
+            # Another handler may have refreshed the cache while we waited
+            flights = fresh_flights(mode)
+            if flights is None:
+                return await load_or_refresh_flights(mode, now)
+    record_cache_lookup(True)
+    return flights
+
+def load_flights_from_disk(mode, now):
+    # A previous process may have left a still-valid copy on disk
+    saved = load_cache_file(mode)
+    if not saved:
+        return None
+    flights = parse_flights(saved['response'], mode, now)
+    if not flights:
+        return None
+    store_flights(mode, flights, saved['timestamp'], saved['expires'])
+    return flights
+
+async def load_or_refresh_flights(mode, now):
+    flights = load_flights_from_disk(mode, now)
+    if flights:
+        record_cache_lookup(True)
+        return flights
+
+    record_cache_lookup(False)
+    return await refresh_flights(mode, now)
+
+def parse_flights(raw_flights, mode, now):
+    processed_flights = []
+    seen_flights = set()
+
+    # Window bounds as naive local times so the filter runs before localizing
+    now_naive = now.replace(tzinfo=None)
+    earliest = now_naive - timedelta(minutes=20)
+    latest = now_naive + timedelta(hours=24)
+
+    # Resolve the mode-specific field names once, not per flight
+    prefix = 'arr' if mode == 'arrival' else 'dep'
+    time_key = f'{prefix}_time'
+    est_key = f'{prefix}_estimated'
+    term_key = f'{prefix}_terminal'
+
+    for f in raw_flights:
+        try:
+            code = f.get('airline_iata')
+            num = f.get('flight_number')
+            
+            if not code or not num: continue
+
+            # --- FILTERS ---
+            if code in CARGO_AIRLINES: continue 
+            if f.get('cs_flight_number'): continue
+            
+            uid = f"{code}{num}"
+            if uid in seen_flights: continue
+            seen_flights.add(uid)
+
+            # --- TIMING ---
+            sched_str = f.get(time_key)
+            est_str = f.get(est_key)
+            
+            if not sched_str: continue
+            
+            final_str = est_str if est_str else sched_str
+            
+            final_dt = datetime.fromisoformat(final_str)
+
+            if final_dt < earliest: continue
+            if final_dt > latest: continue
+
+            # Most rows have no estimate (or one equal to the schedule);
+            # only parse the schedule separately when it can differ
+            if final_str == sched_str:
+                delay_mins = 0
+            else:
+                sched_dt = datetime.fromisoformat(sched_str)
+                delay_mins = int((final_dt - sched_dt).total_seconds() / 60)
+            final_local = final_dt.replace(tzinfo=TIMEZONE)
+            
+            # --- STATUS ---
+            cancelled = f.get('status', '').lower() == 'cancelled'
+            delayed = not cancelled and delay_mins > 15
+            status_display = ""
+            status_icon = ""
+            
+            if cancelled:
+                status_display = "🔴 CANCELLED"
+                status_icon = "🔴 "
+            elif delayed:
+                status_display = f"⚠️ Delayed {delay_mins}m"
+                status_icon = "⚠️ "
+            
+            # --- ZONE ---
+            api_term = f.get(term_key)
+            if api_term:
+                # Terminal values vary ("C", "C2", "Terminal A"), so look for
+                # the letter anywhere; C wins if both appear
+                api_term = str(api_term)
+                if 'C' in api_term: zone = "Zone C (North)"
+                elif 'A' in api_term or 'B' in api_term: zone = "Zone A/B (Rotunda)"
+                else: zone = "Check Screen"
+            elif code in TERMINAL_MAP:
+                zone = TERMINAL_MAP[code]
+            else:
+                zone = "Zone A/B"
+                if code not in unmapped_airlines:
+                    unmapped_airlines.add(code)
+                    logger.info(f"No terminal mapping for airline {code}, defaulting to {zone}")
+
+            processed_flights.append(Flight(
+                airline_safe=AIRLINE_LABELS.get(code) or html.escape(code),
+                code=code,
+                num=num,
+                time=final_local,
+                time_str=final_local.strftime('%H:%M'),
+                zone=zone,
+                check_screen="Check Screen" in zone,
+                status=status_display,
+                status_icon=status_icon,
+                cancelled=cancelled,
+                is_problem=cancelled or delayed
+            ))
+        except Exception:
+            continue
+
+    processed_flights.sort(key=flight_time)
+    return processed_flights
+
+def keep_last_flights(mode, current_time):
+    # Keep serving the last good list rather than an empty board, and hold
+    # off on the next attempt for a few minutes (even with nothing cached)
+    cache = flight_cache[mode]
+    flights = cache["data"] if cache["data"] is not None else []
+    store_flights(mode, flights, cache["timestamp"], current_time + STALE_RETRY_DELAY, stale=True)
+    return flights
+
+async def refresh_flights(mode, now):
     current_time = time.time()
-    
-    if flight_cache[mode]["data"] and (current_time - flight_cache[mode]["timestamp"] < CACHE_DURATION):
-        return flight_cache[mode]["data"]
+    if current_time < api_backoff["until"]:
+        return keep_last_flights(mode, current_time)
 
     logger.info(f"Fetching {mode} from AirLabs...")
     base_url = "https://airlabs.co/api/v9/schedules"
@@ -105,88 +447,90 @@ def fetch_flights(mode):
     }
 
     try:
-        r = requests.get(base_url, params=params, timeout=15)
-        data = r.json()
+        r = await http_client.get(base_url, params=params)
+        if r.status_code == 429:
+            # Quota is per key, so back off both modes, not just this one
+            api_backoff["until"] = current_time + RATE_LIMIT_BACKOFF
+            logger.warning(f"AirLabs rate limit hit, pausing requests for {RATE_LIMIT_BACKOFF}s")
+            return keep_last_flights(mode, current_time)
+        if r.is_error:
+            # Not raise_for_status(): its message includes the URL, api_key and all
+            raise ValueError(f"HTTP {r.status_code} {r.reason_phrase}")
+        data = orjson.loads(r.content)
+        # AirLabs reports some failures (bad key, quota) in a 200 body
+        if 'error' in data:
+            raise ValueError(data['error'])
         
         raw_flights = data.get('response', [])
-        processed_flights = []
-        now = get_spokane_time()
-        seen_flights = set()
-
-        for f in raw_flights:
-            try:
-                code = f.get('airline_iata')
-                num = f.get('flight_number')
-                
-                if not code or not num: continue
-
-                # --- FILTERS ---
-                if f.get('cs_flight_number'): continue
-                
-                uid = f"{code}{num}"
-                if uid in seen_flights: continue
-                seen_flights.add(uid)
-
-                if code in ['FX', '5X', 'PO', 'K4', 'QY', 'ABX', 'ATI']: continue 
-
-                # --- TIMING ---
-                sched_str = f.get('arr_time') if mode == 'arrival' else f.get('dep_time')
-                est_str = f.get('arr_estimated') if mode == 'arrival' else f.get('dep_estimated')
-                
-                if not sched_str: continue
-                
-                final_str = est_str if est_str else sched_str
-                
-                sched_dt = datetime.strptime(sched_str, '%Y-%m-%d %H:%M')
-                sched_local = TIMEZONE.localize(sched_dt)
-                
-                final_dt = datetime.strptime(final_str, '%Y-%m-%d %H:%M')
-                final_local = TIMEZONE.localize(final_dt)
-
-                if final_local < now - timedelta(minutes=20): continue
-                if final_local > now + timedelta(hours=24): continue
-
-                delay_mins = int((final_local - sched_local).total_seconds() / 60)
-                
-                # --- STATUS ---
-                api_status = f.get('status', '').lower()
-                status_display = ""
-                
-                if api_status == 'cancelled':
-                    status_display = "🔴 CANCELLED"
-                elif delay_mins > 15:
-                    status_display = f"⚠️ Delayed {delay_mins}m"
-                
-                # --- ZONE ---
-                api_term = f.get('arr_terminal') if mode == 'arrival' else f.get('dep_terminal')
-                zone = "Check Screen"
-                if api_term:
-                    if 'C' in str(api_term): zone = "Zone C (North)"
-                    elif 'A' in str(api_term) or 'B' in str(api_term): zone = "Zone A/B (Rotunda)"
-                else:
-                    zone = TERMINAL_MAP.get(code, "Zone A/B")
-
-                processed_flights.append({
-                    'airline': AIRLINE_NAMES.get(code, code),
-                    'code': code,
-                    'num': num,
-                    'time': final_local,
-                    'time_str': final_local.strftime('%H:%M'),
-                    'zone': zone,
-                    'status': status_display, 
-                    'is_problem': (api_status == 'cancelled' or delay_mins > 15)
-                })
-            except Exception:
-                continue
-
-        processed_flights.sort(key=lambda x: x['time'])
-        flight_cache[mode]["data"] = processed_flights
-        flight_cache[mode]["timestamp"] = current_time
+        processed_flights = parse_flights(raw_flights, mode, now)
+
+        # Clamp after jittering so MAX_CACHE_DURATION stays a real ceiling
+        ttl = min(derive_ttl(processed_flights, now) * jitter_rng.uniform(*CACHE_JITTER), MAX_CACHE_DURATION)
+        store_flights(mode, processed_flights, current_time, current_time + ttl)
+        if processed_flights:
+            save_cache_file(mode, raw_flights, current_time, current_time + ttl)
         return processed_flights
 
     except Exception as e:
         logger.error(f"API Error: {e}")
-        return []
+        return keep_last_flights(mode, current_time)
+
+async def fetch_all_flights(now):
+    arr, dep = await asyncio.gather(fetch_flights('arrival', now), fetch_flights('departure', now))
+    return arr, dep
+
+async def get_problem_flights(now):
+    arr, dep = await fetch_all_flights(now)
+    key = (flight_cache['arrival']['timestamp'], flight_cache['departure']['timestamp'])
+    if problem_cache['key'] != key:
+        # (label, flight) pairs; the cached Flight records are left untouched
+        problems = [
+            (label, f)
+            for label, f in chain(zip(repeat("🛬 Arr"), arr), zip(repeat("🛫 Dep"), dep))
+            if f.is_problem
+        ]
+        problems.sort(key=lambda x: x[1].time)
+        problem_cache['key'] = key
+        problem_cache['data'] = problems
+
+    # Like the boards, drop flights that have aged out since the fetch
+    problems = problem_cache['data']
+    start = bisect.bisect_left(problems, now - timedelta(minutes=20), key=lambda x: x[1].time)
+    return problems[start:]
+
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    last_user_activity["time"] = time.time()
+
+async def refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    # Refresh shortly before expiry so the next command hits a warm cache,
+    # but leave AirLabs alone while nobody is using the bot
+    if time.time() - last_user_activity["time"] > ACTIVE_USER_WINDOW:
+        return
+    for mode in flight_cache:
+        # Only keep warm what someone has actually asked for
+        if flight_cache[mode]["data"] is None:
+            continue
+        if flight_cache[mode]["expires"] - time.time() > PREFETCH_LEAD:
+            continue
+        async with flight_locks[mode]:
+            if flight_cache[mode]["expires"] - time.time() <= PREFETCH_LEAD:
+                await refresh_flights(mode, get_spokane_time())
+
+    # /status also waits on the weather, so keep that warm too
+    if weather_cache["expires"] - time.time() <= PREFETCH_LEAD:
+        async with weather_lock:
+            if weather_cache["expires"] - time.time() <= PREFETCH_LEAD:
+                await refresh_weather()
+
+async def warm_cache_from_disk(application):
+    # Populate memory at startup so the first command after a restart is a hit
+    now = get_spokane_time()
+    for mode in flight_cache:
+        if load_flights_from_disk(mode, now):
+            logger.info(f"Restored {mode} cache from disk")
+
+async def close_http_client(application):
+    await http_client.aclose()
 
 async def safe_edit(context, chat_id, msg_id, text, reply_markup=None):
     try:
@@ -204,6 +548,38 @@ async def safe_edit(context, chat_id, msg_id, text, reply_markup=None):
     except Exception:
         await context.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML', reply_markup=reply_markup)
 
+async def send_loading(update: Update, text, ready):
+    # Skip the placeholder round trip when the answer is already cached
+    if ready:
+        return None
+    return await update.message.reply_text(text)
+
+async def respond(update: Update, context, msg, text, reply_markup=None):
+    # msg is the loading placeholder, or None if nothing had to be fetched
+    if msg is not None:
+        await safe_edit(context, update.effective_chat.id, msg.message_id, text, reply_markup)
+        return
+    if len(text) > 4000: text = text[:4000] + "\n... (truncated)"
+    await update.message.reply_text(
+        text, parse_mode='HTML', reply_markup=reply_markup, disable_web_page_preview=True
+    )
+
+def cooldown(seconds=COMMAND_COOLDOWN):
+    # Per-chat, per-command throttle so repeated taps don't re-run the work
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            key = (update.effective_chat.id, handler.__name__)
+            now = time.monotonic()
+            last = last_command_call.get(key)
+            if last is not None and now - last < seconds:
+                await update.message.reply_text("⏱ Please wait a few seconds before trying again.")
+                return
+            last_command_call[key] = now
+            return await handler(update, context)
+        return wrapper
+    return decorator
+
 # --- BOT COMMANDS --- #
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -236,18 +612,21 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(message, parse_mode='HTML')
 
+@cooldown()
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    msg = await update.message.reply_text("📡 Analyzing...")
+    ready = fresh_flights('arrival') is not None and time.time() < weather_cache["expires"]
+    msg = await send_loading(update, "📡 Analyzing...", ready)
+    # One clock reading per command, shared by every helper below
+    now = get_spokane_time()
     try:
-        temp, weather = get_weather()
+        (temp, weather), flights = await asyncio.gather(get_weather(), fetch_flights('arrival', now))
         # QA FIX: Sanitize weather string
         weather_safe = html.escape(str(weather)) if weather else "Unavailable"
         
-        flights = fetch_flights('arrival')
-        now = get_spokane_time()
-        
-        active_flights = [f for f in flights if "CANCELLED" not in f['status']]
-        count = len([f for f in active_flights if now < f['time'] < now + timedelta(hours=1)])
+        # flights is sorted by time, so the next hour is one contiguous slice
+        start = bisect.bisect_right(flights, now, key=flight_time)
+        end = bisect.bisect_left(flights, now + timedelta(hours=1), key=flight_time)
+        count = sum(1 for f in flights[start:end] if not f.cancelled)
         
         strategy = "⚪ Stay Downtown"
         if count >= 2: strategy = "🟡 Head to Cell Phone Lot"
@@ -257,115 +636,113 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text = (f"📊 <b>STATUS: {now.strftime('%I:%M %p')}</b>\n"
                 f"🌡️ {temp}°F, {weather_safe}\n"
                 f"🛬 Inbound (1hr): {count} planes\n"
-                f"🚦 {strategy}")
+                f"🚦 {strategy}"
+                f"{stale_note('arrival')}")
 
-        # QA FIX: Correct Google Maps Universal Link
-        map_url = "https://www.google.com/maps/search/?api=1&query=Spokane+International+Airport+Cell+Phone+Waiting+Lot"
-        keyboard = [[InlineKeyboardButton("🗺️ Nav to Waiting Lot", url=map_url)]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await safe_edit(context, update.effective_chat.id, msg.message_id, text, reply_markup)
+        await respond(update, context, msg, text, NAV_MARKUP)
     except Exception as e:
-        await safe_edit(context, update.effective_chat.id, msg.message_id, f"Error: {e}")
-
-async def show_arrivals(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    msg = await update.message.reply_text("📡 Fetching Arrivals...")
-    flights = fetch_flights('arrival')
-    
-    if not flights:
-        await safe_edit(context, update.effective_chat.id, msg.message_id, "No upcoming arrivals.")
-        return
+        await respond(update, context, msg, f"Error: {e}")
 
-    text = "🛬 <b>ARRIVALS</b>\nTime | Airline | Flight | Pickup | Zone\n"
-    text += "-----------------------------------------\n"
+def render_board(mode, flights):
+    board = BOARDS[mode]
+    parts = [board['header'], "-----------------------------------------\n"]
     
     has_check_screen = False
     for f in flights[:15]:
-        pickup = (f['time'] + timedelta(minutes=20)).strftime('%H:%M')
-        status_icon = "⚠️ " if "Delayed" in f['status'] else ("🔴 " if "CANCELLED" in f['status'] else "")
-        airline_safe = html.escape(f['airline'])
-        
-        if "Check Screen" in f['zone']:
+        if f.check_screen:
             has_check_screen = True
-        
-        line = f"{status_icon}{f['time_str']} | {airline_safe} | {f['code']}{f['num']} | {pickup} | {f['zone']}\n"
-        text += line
+
+        # Arrivals add the curbside pickup column (landing + 20 min)
+        pickup = ""
+        if mode == 'arrival':
+            pickup = (f.time + timedelta(minutes=20)).strftime('%H:%M') + " | "
+
+        line = (f"{f.status_icon}{f.time_str} | {f.airline_safe} | "
+                f"{f.code}{f.num} | {pickup}{f.zone}\n")
+        parts.append(line)
     
     if has_check_screen:
-        text += CHECK_SCREEN_EXPLANATION
+        parts.append(CHECK_SCREEN_EXPLANATION)
     
-    await safe_edit(context, update.effective_chat.id, msg.message_id, text)
-
-async def show_departures(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    msg = await update.message.reply_text("📡 Fetching Departures...")
-    flights = fetch_flights('departure')
+    return "".join(parts)
+
+def get_board_text(mode, flights, start):
+    # The board only changes when the cached flight list is replaced or
+    # older flights drop off the top
+    cached = board_cache[mode]
+    if cached["source"] is not flights or cached["start"] != start:
+        cached["text"] = render_board(mode, flights[start:])
+        cached["source"] = flights
+        cached["start"] = start
+    return cached["text"]
+
+async def show_board(update: Update, context: ContextTypes.DEFAULT_TYPE, mode):
+    board = BOARDS[mode]
+    msg = await send_loading(update, board['loading'], fresh_flights(mode) is not None)
+    now = get_spokane_time()
+    flights = await fetch_flights(mode, now)
+    # The cached list keeps the window from fetch time; drop flights that
+    # have since fallen out of it
+    start = bisect.bisect_left(flights, now - timedelta(minutes=20), key=flight_time)
     
-    if not flights:
-        await safe_edit(context, update.effective_chat.id, msg.message_id, "No upcoming departures.")
+    if start == len(flights):
+        await respond(update, context, msg, board['empty'] + stale_note(mode))
         return
 
-    text = "🛫 <b>DEPARTURES</b>\nTime | Airline | Flight | Zone\n"
-    text += "-----------------------------------------\n"
-    
-    has_check_screen = False
-    for f in flights[:15]:
-        status_icon = "⚠️ " if "Delayed" in f['status'] else ("🔴 " if "CANCELLED" in f['status'] else "")
-        airline_safe = html.escape(f['airline'])
-        
-        if "Check Screen" in f['zone']:
-            has_check_screen = True
+    text = get_board_text(mode, flights, start) + stale_note(mode)
+    await respond(update, context, msg, text)
 
-        line = (f"{status_icon}{f['time_str']} | {airline_safe} | "
-                f"{f['code']}{f['num']} | {f['zone']}\n")
-        text += line
-    
-    if has_check_screen:
-        text += CHECK_SCREEN_EXPLANATION
-    
-    await safe_edit(context, update.effective_chat.id, msg.message_id, text)
+@cooldown()
+async def show_arrivals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_board(update, context, 'arrival')
+
+@cooldown()
+async def show_departures(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_board(update, context, 'departure')
 
+@cooldown()
 async def show_delays(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    msg = await update.message.reply_text("📡 Scanning for Issues...")
-    arr = fetch_flights('arrival')
-    dep = fetch_flights('departure')
-    
-    problems = []
-    # Use .copy() to avoid cache mutation
-    for f in arr:
-        if f['is_problem']: 
-            p = f.copy()
-            p['type'] = "🛬 Arr"
-            problems.append(p)
-    for f in dep:
-        if f['is_problem']: 
-            p = f.copy()
-            p['type'] = "🛫 Dep"
-            problems.append(p)
-            
-    problems.sort(key=lambda x: x['time'])
+    ready = all(fresh_flights(mode) is not None for mode in flight_cache)
+    msg = await send_loading(update, "📡 Scanning for Issues...", ready)
+    problems = await get_problem_flights(get_spokane_time())
     
     if not problems:
-        await safe_edit(context, update.effective_chat.id, msg.message_id, "✅ All systems normal. No major delays found.")
+        await respond(update, context, msg, "✅ All systems normal. No major delays found." + stale_note(*flight_cache))
         return
 
-    text = "🚨 <b>TROUBLE MONITOR (Delays/Cancels)</b>\n"
-    text += "-----------------------------------------\n"
-    
-    for f in problems[:20]:
-        status_safe = html.escape(f['status'])
-        line = f"{f['time_str']} | {f['type']} | {f['code']}{f['num']} | <b>{status_safe}</b>\n"
-        text += line
+    lines = [
+        f"{f.time_str} | {label} | {f.code}{f.num} | <b>{html.escape(f.status)}</b>\n"
+        for label, f in problems[:20]
+    ]
+    text = ("🚨 <b>TROUBLE MONITOR (Delays/Cancels)</b>\n"
+            "-----------------------------------------\n" + "".join(lines) + stale_note(*flight_cache))
         
-    await safe_edit(context, update.effective_chat.id, msg.message_id, text)
+    await respond(update, context, msg, text)
 
 if __name__ == '__main__':
-    threading.Thread(target=run_web_server).start()
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    threading.Thread(target=run_web_server, daemon=True).start()
+    application = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .connection_pool_size(16)
+        .pool_timeout(20)
+        .get_updates_connection_pool_size(4)
+        .get_updates_pool_timeout(30)
+        .connect_timeout(10)
+        .read_timeout(20)
+        .rate_limiter(AIORateLimiter())
+        .post_init(warm_cache_from_disk)
+        .post_shutdown(close_http_client)
+        .build()
+    )
     
+    application.add_handler(TypeHandler(Update, track_activity), group=-1)
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('status', status))
     application.add_handler(CommandHandler('arrivals', show_arrivals))
     application.add_handler(CommandHandler('departures', show_departures))
     application.add_handler(CommandHandler('delays', show_delays))
+
+    application.job_queue.run_repeating(refresh_job, interval=PREFETCH_INTERVAL, first=PREFETCH_INTERVAL)
     
     application.run_polling()